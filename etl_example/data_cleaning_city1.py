@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import re
 import unicodedata
@@ -5,6 +6,12 @@ import os
 import glob
 from datetime import datetime, timedelta
 import unidecode
+from row_fingerprint import (
+    add_row_fingerprint, compute_row_fingerprint, drop_duplicate_fingerprints, save_fingerprint_sidecar,
+    to_csv_with_fingerprints, attach_fingerprint_sidecar, FINGERPRINT_COL,
+)
+from data_quality_sketches import DataQualitySketch, raw_missing_mask
+from partitioned_output import write_partitioned
 
 DEFAULT_PRICES_City1 = {
     2018: "20E",
@@ -104,6 +111,13 @@ GROUP_KEYWORDS = {
     ]
 }
 
+# Header spellings used by exported copies of the merged dataset
+COLUMN_ALIASES = {
+    "Data": "Date",
+    "Room type": "Room Type",
+    "City": "city",
+}
+
 
 
 def categorize_age(age):
@@ -211,6 +225,22 @@ def round_to_casual_time(time_obj):
         return None
 
 
+def add_time_slot(df):
+    '''
+    Add a 'Slot' column with Time rounded to the casual time slots and a
+    'Start Minutes' column with the unrounded start time in minutes.
+    '''
+    parsed = pd.to_datetime(df["Time"], format="%H:%M", errors="coerce")
+    mask = parsed.isna()
+    if mask.any():
+        parsed.loc[mask] = pd.to_datetime(df.loc[mask, "Time"], format="%H:%M:%S", errors="coerce")
+    df["Start Minutes"] = parsed.dt.hour * 60 + parsed.dt.minute
+    df["Slot"] = None
+    valid = parsed.notna()
+    df.loc[valid, "Slot"] = parsed[valid].dt.time.apply(round_to_casual_time)
+    return df
+
+
 def clean_text(text):
     '''Normalize and clean text by converting to uppercase, removing accents, and filtering out unwanted characters.'''
     if pd.isna(text):
@@ -348,35 +378,27 @@ def filter_rooms(room_list):
     return filtered
 
 
-def process_file(input_path, output_path):
-    '''Load a CSV file, clean and standardize the data, then save the cleaned DataFrame.'''
-    filename = os.path.basename(input_path)
-    year_match = re.search(r'(\d{4})', filename)
-    if not year_match:
-        print(f"Year not found in filename: {filename}. Skipping file.")
-        return
-    file_year = int(year_match.group(1))
-
-    try:
-        df = pd.read_csv(input_path, dtype=str)
-        if df.empty:
-            print(f"Skipping empty file: {input_path}")
-            return
-    except pd.errors.EmptyDataError:
-        print(f"Skipping empty or invalid file: {input_path}")
-        return
-
-    df.drop_duplicates(inplace=True)
+def filter_file_year(df, file_year):
+    '''Keep rows whose Date falls in file_year and format Date as YYYY-MM-DD.'''
     df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
     df = df.dropna(subset=['Date'])
     df = df[df['Date'].dt.year == file_year]
-    if df.empty:
-        print(f"No rows matching year {file_year} in file: {filename}. Skipping save.")
-        return
     df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+    return df
+
 
+def clean_carried_columns(df, state):
+    '''
+    Clean Time, Room Type and Admin, the steps that depend on earlier rows.
+    state holds the last forward-fill values so a file can be cleaned in
+    chunks; pass an empty dict for a whole file.
+    '''
     if 'Time' in df.columns:
         df['Time'] = df['Time'].fillna(method='ffill')
+        if state.get('Time') is not None:
+            df['Time'] = df['Time'].fillna(state['Time'])
+        if len(df) and pd.notna(df['Time'].iloc[-1]):
+            state['Time'] = df['Time'].iloc[-1]
         parsed = pd.to_datetime(df['Time'], format='%H:%M:%S', errors='coerce')
         mask = parsed.isna()
         if mask.any():
@@ -395,8 +417,43 @@ def process_file(input_path, output_path):
 
     if 'Admin' in df.columns:
         df['Admin'] = df['Admin'].apply(clean_text)
-        df['Admin'] = df['Admin'].replace('', pd.NA).fillna(method='ffill').fillna('')
+        df['Admin'] = df['Admin'].replace('', pd.NA).fillna(method='ffill')
+        if state.get('Admin') is not None:
+            df['Admin'] = df['Admin'].fillna(state['Admin'])
+        if len(df) and pd.notna(df['Admin'].iloc[-1]):
+            state['Admin'] = df['Admin'].iloc[-1]
+        df['Admin'] = df['Admin'].fillna('')
+
+    return df
 
+
+def split_open_price_block(df):
+    '''
+    Split off trailing rows that clean_price_series_City1 could still merge
+    with rows of the next chunk: the last valid price and the empty rows
+    after it. Returns (ready, pending).
+    '''
+    if 'Revenue' not in df.columns or df.empty:
+        return df, df.iloc[0:0]
+
+    values = df['Revenue'].fillna("").astype(str).str.upper().tolist()
+    pos = len(values) - 1
+    while pos >= 0 and values[pos].strip() in ["", "NO_PRICE", "NAN"]:
+        pos -= 1
+    if pos < 0:
+        return df, df.iloc[0:0]
+
+    if any(30 <= int(m) <= 600 for m in re.findall(r'\d+', values[pos].strip())):
+        return df.iloc[:pos], df.iloc[pos:]
+    return df, df.iloc[0:0]
+
+
+def finish_rows(df, file_year):
+    '''
+    Clean prices and row-level fields, derive age groups and order columns.
+    The raw fingerprint is replaced by one of the cleaned row, which the
+    final merge deduplicates on.
+    '''
     if 'Revenue' in df.columns:
         df['Revenue'] = clean_price_series_City1(df['Revenue'], file_year)
 
@@ -459,15 +516,223 @@ def process_file(input_path, output_path):
     ]
     column_order = [col for col in column_order if col in df.columns]
     df = df.reindex(columns=column_order, fill_value='')
+    df[FINGERPRINT_COL] = compute_row_fingerprint(df)
+    return df
+
+
+def raw_quality_flags(df):
+    '''
+    Flag raw cells for the data-quality sketch, before any cleaning:
+    'missing' marks empty cells, 'filled' marks cells that will be replaced
+    by a default because they are missing or cannot be parsed, and
+    'no_price' marks merged price cells.
+    '''
+    missing = raw_missing_mask(df)
+    filled = pd.DataFrame(index=df.index)
+
+    for col in ['Source', 'Admin', 'Celebration', 'Status']:
+        if col in df.columns:
+            filled[col] = missing[col]
+    if 'Helps' in df.columns:
+        filled['Helps'] = pd.to_numeric(df['Helps'], errors='coerce').isna()
+    if 'Revenue' in df.columns:
+        numbers = df['Revenue'].fillna('').astype(str).str.findall(r'\d+')
+        filled['Revenue'] = ~numbers.apply(lambda ms: any(30 <= int(m) <= 600 for m in ms))
+
+    age_cols = [col for col in df.columns if col == 'Age' or re.match(r'Unnamed: \d+', col)]
+    has_age = pd.Series(False, index=df.index)
+    for col in age_cols:
+        has_age |= df[col].fillna('').astype(str).str.contains(r'\d')
+    filled['Age Group'] = ~has_age
+
+    no_price = df['Revenue'].eq('NO_PRICE') if 'Revenue' in df.columns else pd.Series(False, index=df.index)
+    return {'missing': missing, 'filled': filled, 'no_price': no_price}
+
+
+def concat_quality_flags(first, second):
+    '''Stack the raw flags of two consecutive row ranges.'''
+    if first is None:
+        return second
+    return {key: pd.concat([first[key], second[key]]) for key in second}
+
+
+def select_quality_flags(flags, index):
+    '''Keep the raw flags of the rows in index.'''
+    return {key: value.loc[index] for key, value in flags.items()}
+
+
+def update_file_sketch(sketch, df, flags, month_sketches=None):
+    '''
+    Add cleaned rows to a DataQualitySketch using their raw-cell flags.
+    If month_sketches (a dict) is given, rows are also added to one sketch
+    per 'YYYY-MM' month.
+    Escape Time, Celebration and Status defaults are only ever written for
+    unusable values, so they are read from the cleaned rows.
+    '''
+    flags = select_quality_flags(flags, df.index)
+    filled = flags['filled'].copy()
+    cleaned_defaults = {'Escape Time': '-', 'Celebration': 'Be šventės', 'Status': 'Kita'}
+    for col, default in cleaned_defaults.items():
+        if col in df.columns:
+            flag = df[col].astype(str) == default
+            filled[col] = filled[col] | flag if col in filled.columns else flag
+
+    missing = flags['missing'][[col for col in df.columns if col in flags['missing'].columns]]
+    no_price = flags['no_price']
+    sketch.update(df, raw_missing=missing, filled=filled, no_price=no_price.sum())
+
+    if month_sketches is None:
+        return
+    for month, part in df.groupby(df['Date'].str[:7]):
+        month_sketch = month_sketches.setdefault(month, DataQualitySketch(label=month))
+        month_sketch.update(
+            part,
+            raw_missing=missing.loc[part.index],
+            filled=filled.loc[part.index],
+            no_price=no_price.loc[part.index].sum(),
+        )
 
-    df.to_csv(output_path, index=False)
+
+def process_file(input_path, output_path, sketch=None, chunksize=None, month_sketches=None):
+    '''
+    Load a CSV file, clean and standardize the data, then save the cleaned DataFrame.
+    If a DataQualitySketch is given, it is updated with the cleaned rows,
+    and so are the per-month sketches in month_sketches if given.
+    If chunksize is given, the file is cleaned in chunks (see process_file_chunked).
+    '''
+    filename = os.path.basename(input_path)
+    year_match = re.search(r'(\d{4})', filename)
+    if not year_match:
+        print(f"Year not found in filename: {filename}. Skipping file.")
+        return
+    file_year = int(year_match.group(1))
+
+    if chunksize:
+        return process_file_chunked(input_path, output_path, file_year, chunksize, sketch, month_sketches)
+
+    try:
+        df = pd.read_csv(input_path, dtype=str)
+        if df.empty:
+            print(f"Skipping empty file: {input_path}")
+            return
+    except pd.errors.EmptyDataError:
+        print(f"Skipping empty or invalid file: {input_path}")
+        return
+
+    df = drop_duplicate_fingerprints(df)
+    if sketch is not None:
+        flags = raw_quality_flags(df)
+    df = filter_file_year(df, file_year)
+    if df.empty:
+        print(f"No rows matching year {file_year} in file: {filename}. Skipping save.")
+        return
+
+    df = clean_carried_columns(df, {})
+    df = finish_rows(df, file_year)
+
+    if sketch is not None:
+        update_file_sketch(sketch, df, flags, month_sketches)
+
+    to_csv_with_fingerprints(df, output_path)
+    print(f"Processed and saved: {output_path}")
+
+
+def process_file_chunked(input_path, output_path, file_year, chunksize, sketch=None, month_sketches=None):
+    '''
+    Low-memory version of process_file producing the same output.
+    Reads chunksize rows at a time and appends cleaned rows to output_path.
+    Carried between chunks: seen fingerprints, the last Time and Admin
+    forward-fill values and any price block still open at the chunk end.
+    '''
+    filename = os.path.basename(input_path)
+    try:
+        reader = pd.read_csv(input_path, dtype=str, chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        print(f"Skipping empty or invalid file: {input_path}")
+        return
+
+    seen = set()
+    state = {}
+    pending = None
+    pending_flags = None
+    rows_read = 0
+    rows_in_year = 0
+    written = False
+    fingerprints = []
+
+    def write_rows(df):
+        nonlocal written
+        fingerprints.append(df[FINGERPRINT_COL].to_numpy())
+        df = df.drop(columns=[FINGERPRINT_COL])
+        df.to_csv(output_path, index=False, mode='a' if written else 'w', header=not written)
+        written = True
+
+    for chunk in reader:
+        rows_read += len(chunk)
+        add_row_fingerprint(chunk)
+        chunk = chunk.drop_duplicates(subset=[FINGERPRINT_COL])
+        chunk = chunk[~chunk[FINGERPRINT_COL].isin(seen)]
+        seen.update(chunk[FINGERPRINT_COL].tolist())
+
+        if sketch is not None:
+            flags = concat_quality_flags(pending_flags, raw_quality_flags(chunk))
+
+        chunk = filter_file_year(chunk, file_year)
+        rows_in_year += len(chunk)
+        if chunk.empty:
+            continue
+
+        chunk = clean_carried_columns(chunk, state)
+        columns_only = chunk.iloc[0:0]
+        if pending is not None:
+            chunk = pd.concat([pending, chunk])
+        ready, pending = split_open_price_block(chunk)
+
+        if sketch is not None:
+            pending_flags = select_quality_flags(flags, pending.index)
+
+        if ready.empty:
+            continue
+        ready = finish_rows(ready.copy(), file_year)
+        if sketch is not None:
+            update_file_sketch(sketch, ready, flags, month_sketches)
+        write_rows(ready)
+
+    if rows_read == 0:
+        print(f"Skipping empty file: {input_path}")
+        return
+    if rows_in_year == 0:
+        print(f"No rows matching year {file_year} in file: {filename}. Skipping save.")
+        return
+
+    if pending is not None and not pending.empty:
+        pending = finish_rows(pending.copy(), file_year)
+        if sketch is not None:
+            update_file_sketch(sketch, pending, pending_flags, month_sketches)
+        write_rows(pending)
+
+    if not written:
+        # Every row was dropped while cleaning; like process_file, save the header
+        empty = finish_rows(columns_only.copy(), file_year)
+        if sketch is not None:
+            update_file_sketch(sketch, empty, flags, month_sketches)
+        write_rows(empty)
+
+    save_fingerprint_sidecar(output_path, np.concatenate(fingerprints))
     print(f"Processed and saved: {output_path}")
 
 
 
 
-def process_all_files(input_folder, output_folder, file_pattern="combined_data_*.csv"):
-    '''Process all files matching pattern from input_folder and save cleaned versions to output_folder.'''
+def process_all_files(input_folder, output_folder, file_pattern="combined_data_*.csv", sketch_folder=None, chunksize=None):
+    '''
+    Process all files matching pattern from input_folder and save cleaned versions to output_folder.
+    If sketch_folder is given, data-quality sketches are saved there:
+    <sketch_folder>/run_<timestamp>/ holds one sketch per file, per month and
+    run.json for the whole run; <sketch_folder>/months/<YYYY-MM>.json keeps
+    the latest sketch of every month for month-over-month comparisons.
+    If chunksize is given, files are cleaned in chunks of that many rows to bound memory.
+    '''
     os.makedirs(output_folder, exist_ok=True)
 
     input_paths = glob.glob(os.path.join(input_folder, file_pattern))
@@ -475,18 +740,45 @@ def process_all_files(input_folder, output_folder, file_pattern="combined_data_*
         print("No files found matching pattern.")
         return
 
+    run_sketch = DataQualitySketch(label=f"run_{datetime.now():%Y%m%d_%H%M%S}")
+    month_sketches = {}
+
     for input_path in input_paths:
         base_name = os.path.basename(input_path)
         output_path = os.path.join(output_folder, f"City1_cleaned_{base_name}")
-        process_file(input_path, output_path)
+        if sketch_folder is None:
+            process_file(input_path, output_path, chunksize=chunksize)
+            continue
 
-def merge_cleaned_files(cleaned_folder, output_path):
+        file_sketch = DataQualitySketch(label=base_name)
+        process_file(input_path, output_path, sketch=file_sketch, chunksize=chunksize, month_sketches=month_sketches)
+        file_sketch.save(os.path.join(sketch_folder, run_sketch.label, f"{os.path.splitext(base_name)[0]}.json"))
+        run_sketch.merge(file_sketch)
+
+    if sketch_folder is not None:
+        run_folder = os.path.join(sketch_folder, run_sketch.label)
+        run_sketch.save(os.path.join(run_folder, "run.json"))
+        for month, month_sketch in month_sketches.items():
+            month_sketch.save(os.path.join(run_folder, f"month_{month}.json"))
+            month_sketch.save(os.path.join(sketch_folder, "months", f"{month}.json"))
+        print(f"Saved data-quality sketches to {run_folder}")
+
+def merge_cleaned_files(cleaned_folder, output_path, partition_dir=None, file_format="csv", append=False, months=None):
     '''
     Merge all cleaned CSV files from cleaned_folder into one DataFrame,
     aligning columns by union and filling missing columns with NaN.
-    Save the merged DataFrame to output_path.
+    The cleaned-row fingerprints of the yearly files are carried along in
+    the sidecars of output_path and the partitions.
+    Save the merged DataFrame to output_path (skipped if None) and, if
+    partition_dir is given, as City/Year/Month partitions.
+    If months ('YYYY-MM' list) is given, only the yearly files of those
+    months are read and only their partitions are written; output_path is
+    skipped as it would no longer hold the full history.
     '''
     files = glob.glob(os.path.join(cleaned_folder, "City1_cleaned_combined_data_*.csv"))
+    if months is not None:
+        years = {month[:4] for month in months}
+        files = [f for f in files if years.intersection(re.findall(r'\d{4}', os.path.basename(f)))]
     if not files:
         print("No cleaned files found to merge.")
         return
@@ -494,12 +786,18 @@ def merge_cleaned_files(cleaned_folder, output_path):
     df_list = []
     for f in files:
         df = pd.read_csv(f, dtype=str)
-        df_list.append(df)
+        df_list.append(attach_fingerprint_sidecar(df, f))
 
     merged_df = pd.concat(df_list, axis=0, ignore_index=True, sort=False)
 
-    merged_df.to_csv(output_path, index=False)
-    print(f"Merged all cleaned files into {output_path}")
+    if output_path is not None and months is not None:
+        print(f"Skipping {output_path}: only months {months} were merged")
+    elif output_path is not None:
+        to_csv_with_fingerprints(merged_df, output_path)
+        print(f"Merged all cleaned files into {output_path}")
+
+    if partition_dir is not None:
+        write_partitioned(merged_df, partition_dir, city="City1", file_format=file_format, append=append, months=months)
 
 
 
@@ -512,6 +810,7 @@ if __name__ == "__main__":
 
     os.makedirs(cleaned_folder, exist_ok=True)
 
-    process_all_files(input_folder, cleaned_folder)
+    process_all_files(input_folder, cleaned_folder, sketch_folder=os.path.join(cleaned_folder, "sketches"))
 
-    merge_cleaned_files(cleaned_folder, merged_output_path)
+    # The partitions let full_data.merge_city_data refresh single months
+    merge_cleaned_files(cleaned_folder, merged_output_path, partition_dir=os.path.join(cleaned_folder, "partitioned"))
@@ -1,5 +1,7 @@
 import os
 import pandas as pd
+from partitioned_output import touched_months
+from row_fingerprint import add_row_fingerprint, drop_duplicate_fingerprints, drop_seen_fingerprints, add_seen_fingerprints, FINGERPRINT_COL
 
 '''This script merges multiple monthly CSV files into yearly datasets for each location.
 
@@ -7,7 +9,8 @@ import pandas as pd
 - Forces the first column to become column named 'Date'
 - Standardizes time-related column names to 'SessionDuration'
 - Handles missing or empty CSVs without crashing
-- Drops duplicate rows before saving
+- Adds a fingerprint of each raw row and drops duplicate rows on it before saving
+- Optionally appends only rows not seen in earlier runs
 - Outputs final yearly CSVs into given location'''
 
 
@@ -30,20 +33,40 @@ def read_csv_force_first_col_date(file_path):
 
     first_col = df.columns[0]
     df.rename(columns={first_col: "Date"}, inplace=True)
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
 
     for col in df.columns:
         cleaned = col.lower().replace(" ", "")
         if cleaned in ["duration", "timeescaped", "sessionlength"]:
             df.rename(columns={col: "Escape Time"}, inplace=True)
 
+    # Fingerprint the raw values, before Date is parsed
+    add_row_fingerprint(df)
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+
     return df
 
 
-def combine_yearly_csvs(input_dir, file_dict, output_dir):
+def read_csv_header(file_path):
+    '''Column names of an existing CSV, or an empty list if it has no header.'''
+    try:
+        return pd.read_csv(file_path, nrows=0, encoding="utf-8").columns.tolist()
+    except pd.errors.EmptyDataError:
+        return []
+
+
+def combine_yearly_csvs(input_dir, file_dict, output_dir, seen_path=None, append=False):
 
-    '''Combine multiple monthly CSV files into a single yearly CSV.'''
+    '''
+    Combine multiple monthly CSV files into a single yearly CSV.
+    If seen_path is given, fingerprints of saved rows are persisted there.
+    With append=True, only rows not in that set are appended to an existing
+    yearly file, so new months are deduplicated without reloading history.
+    A column that first appears in a new month is added to the yearly file.
+    Returns the 'YYYY-MM' months of the rows written, to pass as months= to
+    the merge steps so only those partitions are refreshed.
+    '''
     os.makedirs(output_dir, exist_ok=True)
+    written_months = set()
 
     for year, file_list in file_dict.items():
         combined = []
@@ -64,9 +87,30 @@ def combine_yearly_csvs(input_dir, file_dict, output_dir):
 
         if combined:
             final_df = pd.concat(combined, ignore_index=True)
-            final_df.drop_duplicates(inplace=True)
-            final_df.to_csv(output_file, index=False, encoding="utf-8")
-            print(f"Year {year}: saved {output_file}")
+
+            # An empty yearly file (from a run without data) is treated as missing
+            header = read_csv_header(output_file) if append and seen_path and os.path.exists(output_file) else []
+
+            if header:
+                new_df = drop_seen_fingerprints(final_df, seen_path)
+                new_columns = [col for col in new_df.columns if col not in header]
+                if new_columns:
+                    # Rewrite history once with the new columns instead of dropping them
+                    print(f"Year {year}: adding new columns {new_columns} to {output_file}")
+                    header += new_columns
+                    existing = pd.read_csv(output_file, dtype=str, encoding="utf-8")
+                    existing.reindex(columns=header).to_csv(output_file, index=False, encoding="utf-8")
+                new_df = new_df.reindex(columns=header)
+                new_df.to_csv(output_file, mode="a", header=False, index=False, encoding="utf-8")
+                written_months.update(touched_months(new_df["Date"]))
+                print(f"Year {year}: appended {len(new_df)} new rows to {output_file}")
+            else:
+                final_df = drop_duplicate_fingerprints(final_df)
+                final_df.to_csv(output_file, index=False, encoding="utf-8")
+                if seen_path:
+                    add_seen_fingerprints(seen_path, final_df[FINGERPRINT_COL])
+                written_months.update(touched_months(final_df["Date"]))
+                print(f"Year {year}: saved {output_file}")
         else:
             pd.DataFrame().to_csv(output_file, index=False, encoding="utf-8")
             print(f"Year {year}: no data, created empty file")
@@ -75,6 +119,8 @@ def combine_yearly_csvs(input_dir, file_dict, output_dir):
         print(f"Included: {ok_files}")
         print(f"Missing: {bad_files}\n")
 
+    return sorted(written_months)
+
 
 def main():
     # Location A
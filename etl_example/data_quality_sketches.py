@@ -0,0 +1,289 @@
+import os
+import json
+import base64
+import glob
+import numpy as np
+import pandas as pd
+
+'''Streaming data-quality sketches collected while files are cleaned.
+
+- HyperLogLog distinct counts for Admin, Source and Room Type
+- Log-bucket quantile sketches for Revenue and Escape Time
+- Null and default-fill rates for every column, plus NO_PRICE counts
+- Sketches are saved per file, per month and per run as small JSON files
+- Sketches merge without rescanning data, so runs can be compared instantly'''
+
+
+DISTINCT_COLUMNS = ['Admin', 'Source', 'Room Type']
+QUANTILE_COLUMNS = ['Revenue', 'Escape Time']
+
+def _hash_values(values):
+    '''Hash values to uint64 using the same hashing as pandas.'''
+    values = pd.Series(values, dtype=object).dropna().astype(str)
+    values = values[values.str.strip() != '']
+    return pd.util.hash_array(values.to_numpy(dtype=object))
+
+
+def _bit_length(x):
+    '''Vectorized bit length of a uint64 array.'''
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        n[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    '''Mergeable distinct-count sketch (2**p registers, ~1.6% error at p=12).'''
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        self.registers = registers
+
+    def update(self, values):
+        hashes = _hash_values(values)
+        if len(hashes) == 0:
+            return self
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {'p': self.p, 'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data):
+        registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return cls(p=data['p'], registers=registers)
+
+
+class QuantileSketch:
+    '''
+    Mergeable quantile sketch with logarithmic buckets.
+    Any returned quantile is within relative_accuracy of the true value.
+    '''
+
+    def __init__(self, relative_accuracy=0.01, buckets=None, zero_count=0, count=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.buckets = buckets if buckets is not None else {}
+        self.zero_count = zero_count
+        self.count = count
+
+    def update(self, values):
+        values = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype=float)
+        values = values[values >= 0]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / np.log(self.gamma)).astype(np.int64), return_counts=True)
+        for key, cnt in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + cnt
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge quantile sketches with different accuracy")
+        for key, cnt in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + cnt
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            relative_accuracy=data['relative_accuracy'],
+            buckets={int(k): v for k, v in data['buckets'].items()},
+            zero_count=data['zero_count'],
+            count=data['count'],
+        )
+
+
+class DataQualitySketch:
+    '''All sketches for one file, month or run.'''
+
+    def __init__(self, label=''):
+        self.label = label
+        self.rows = 0
+        self.no_price = 0
+        self.nulls = {}
+        self.defaults = {}
+        self.distinct = {col: HyperLogLog() for col in DISTINCT_COLUMNS}
+        self.quantiles = {col: QuantileSketch() for col in QUANTILE_COLUMNS}
+
+    def update(self, df, raw_missing=None, filled=None, no_price=0):
+        '''
+        Add a cleaned DataFrame to the sketch.
+        raw_missing marks source cells that were empty and filled marks cells
+        the cleaners replaced with a default; both are boolean frames aligned
+        to df.index.
+        '''
+        self.rows += len(df)
+        self.no_price += int(no_price)
+
+        if raw_missing is not None:
+            for col, cnt in raw_missing.sum().items():
+                self.nulls[col] = self.nulls.get(col, 0) + int(cnt)
+
+        if filled is not None:
+            for col, cnt in filled.sum().items():
+                self.defaults[col] = self.defaults.get(col, 0) + int(cnt)
+
+        for col, sketch in self.distinct.items():
+            if col in df.columns:
+                sketch.update(df[col])
+
+        for col, sketch in self.quantiles.items():
+            if col in df.columns:
+                sketch.update(df[col].astype(str).str.extract(r'(\d+(?:\.\d+)?)', expand=False))
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.no_price += other.no_price
+        for col, cnt in other.nulls.items():
+            self.nulls[col] = self.nulls.get(col, 0) + cnt
+        for col, cnt in other.defaults.items():
+            self.defaults[col] = self.defaults.get(col, 0) + cnt
+        for col, sketch in other.distinct.items():
+            self.distinct.setdefault(col, HyperLogLog(p=sketch.p)).merge(sketch)
+        for col, sketch in other.quantiles.items():
+            self.quantiles.setdefault(col, QuantileSketch(sketch.relative_accuracy)).merge(sketch)
+        return self
+
+    def summary(self, quantiles=(0.01, 0.5, 0.99)):
+        '''Return a flat {metric: value} dict for reports and comparisons.'''
+        rows = max(self.rows, 1)
+        result = {'rows': self.rows, 'no_price_rate': round(self.no_price / rows, 4)}
+        for col, sketch in self.distinct.items():
+            result[f'distinct {col}'] = sketch.count()
+        for col, sketch in self.quantiles.items():
+            for q in quantiles:
+                value = sketch.quantile(q)
+                result[f'{col} p{int(q * 100)}'] = None if value is None else round(value, 2)
+        for col, cnt in self.nulls.items():
+            result[f'null_rate {col}'] = round(cnt / rows, 4)
+        for col, cnt in self.defaults.items():
+            result[f'default_rate {col}'] = round(cnt / rows, 4)
+        return result
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'rows': self.rows,
+            'no_price': self.no_price,
+            'nulls': self.nulls,
+            'defaults': self.defaults,
+            'distinct': {col: s.to_dict() for col, s in self.distinct.items()},
+            'quantiles': {col: s.to_dict() for col, s in self.quantiles.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(label=data.get('label', ''))
+        sketch.rows = data['rows']
+        sketch.no_price = data['no_price']
+        sketch.nulls = data['nulls']
+        sketch.defaults = data['defaults']
+        sketch.distinct = {col: HyperLogLog.from_dict(d) for col, d in data['distinct'].items()}
+        sketch.quantiles = {col: QuantileSketch.from_dict(d) for col, d in data['quantiles'].items()}
+        return sketch
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def raw_missing_mask(df):
+    '''Boolean frame marking empty or whitespace-only source cells.'''
+    return df.isna() | df.apply(lambda col: col.astype(str).str.fullmatch(r'\s*'))
+
+
+def merge_sketch_files(paths, label=''):
+    '''Merge saved sketches into one without touching the data.'''
+    merged = DataQualitySketch(label=label)
+    for path in paths:
+        merged.merge(DataQualitySketch.load(path))
+    return merged
+
+
+def compare_sketches(current, previous):
+    '''
+    Compare two sketches side by side.
+    Returns a DataFrame with current, previous and change per metric.
+    '''
+    cur = current.summary()
+    prev = previous.summary()
+    metrics = list(dict.fromkeys(list(cur) + list(prev)))
+    df = pd.DataFrame({
+        'metric': metrics,
+        'current': [cur.get(m) for m in metrics],
+        'previous': [prev.get(m) for m in metrics],
+    })
+    df['change'] = pd.to_numeric(df['current'], errors='coerce') - pd.to_numeric(df['previous'], errors='coerce')
+    return df
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sketch_folder = os.path.join(BASE_DIR, "data", "City1", "cleaned", "sketches")
+
+    months = sorted(glob.glob(os.path.join(sketch_folder, "months", "*.json")))
+    if len(months) < 2:
+        print("Need at least two month sketches to compare.")
+    else:
+        current = DataQualitySketch.load(months[-1])
+        previous = DataQualitySketch.load(months[-2])
+        print(f"Comparing {current.label} to {previous.label}")
+        print(compare_sketches(current, previous).to_string(index=False))
@@ -0,0 +1,293 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from data_cleaning_city1 import COLUMN_ALIASES, add_time_slot
+
+'''Monte Carlo demand simulator for new-room decisions.
+
+- Historical days of bookings per city x TeamType x Age Group x slot x room
+  are resampled from the merged dataset (bootstrap over observed days)
+- Bookings keep the room they had; a proposed room takes over a share of
+  each segment's bookings, based on the room it clones
+- Each room has a per-slot capacity (by default the most sessions
+  observed in one slot), so without proposed rooms history is reproduced
+- demand_scale > 1 adds Poisson extra bookings to each resampled day and
+  demand_scale < 1 thins them, so history stays the reference point
+- Teams that find their room full spill over to free rooms with a
+  configurable probability, otherwise the booking is lost
+- Scenarios are simulated in vectorized NumPy batches across a process pool
+- Reports revenue and utilization distributions per room and the change
+  against the same scenarios without the proposed rooms (cannibalization)
+
+Proposed rooms are dicts, e.g.
+    {"name": "AV2_new", "clone_of": "AV1", "appeal": 1.0,
+     "segments": {"TeamType": ["Kids"]}, "revenue": 90, "capacity": 1}
+Only "name" and "clone_of" are required.'''
+
+
+SEGMENT_COLUMNS = ["TeamType", "Age Group"]
+
+
+def prepare_bookings(df):
+    '''Normalize column names and add Slot and numeric Revenue columns.'''
+    df = df.rename(columns=COLUMN_ALIASES)
+    df = add_time_slot(df.copy())
+    df["Revenue"] = pd.to_numeric(df["Revenue"].astype(str).str.extract(r"(\d+(?:\.\d+)?)", expand=False), errors="coerce")
+    df = df.dropna(subset=["Date", "Slot", "Room Type", "city"])
+    for col in SEGMENT_COLUMNS:
+        df[col] = df[col].fillna("N/A")
+    return df
+
+
+def observed_capacity(bookings):
+    '''
+    Most sessions seen per (city, room) in one day and slot. Some slots
+    hold two sessions (e.g. 13:30 and 15:00 both round to 14:00).
+    '''
+    sessions = bookings.groupby(["city", "Date", "Slot", "Room Type"]).size()
+    return sessions.groupby(["city", "Room Type"]).max()
+
+
+def build_demand_model(bookings, city, proposed_rooms=None, capacity=None):
+    '''
+    Build the arrays the simulator needs for one city.
+    bookings is the output of prepare_bookings for all cities, so proposed
+    rooms can clone a room from another city.
+    capacity maps room names to sessions per slot; rooms not listed use the
+    observed maximum, and proposed rooms that of the room they clone.
+    '''
+    capacity = capacity or {}
+    seen_capacity = observed_capacity(bookings)
+    city_df = bookings[bookings["city"] == city]
+    if city_df.empty:
+        raise ValueError(f"No bookings found for city: {city}")
+
+    segments = sorted(city_df[SEGMENT_COLUMNS].drop_duplicates().itertuples(index=False, name=None))
+    slots = sorted(city_df["Slot"].unique())
+    rooms = sorted(city_df["Room Type"].unique())
+    days = sorted(city_df["Date"].unique())
+
+    seg_index = pd.MultiIndex.from_tuples(segments, names=SEGMENT_COLUMNS)
+    daily = np.zeros((len(days), len(segments), len(slots), len(rooms)), dtype=np.int64)
+    np.add.at(daily, (
+        pd.Index(days).get_indexer(city_df["Date"]),
+        seg_index.get_indexer(pd.MultiIndex.from_frame(city_df[SEGMENT_COLUMNS])),
+        pd.Index(slots).get_indexer(city_df["Slot"]),
+        pd.Index(rooms).get_indexer(city_df["Room Type"]),
+    ), 1)
+
+    revenue = city_df.groupby("Room Type")["Revenue"].mean().reindex(rooms)
+    revenue = revenue.fillna(city_df["Revenue"].mean()).fillna(0).to_numpy(dtype=float)
+    room_capacity = np.array(
+        [capacity.get(room, seen_capacity.get((city, room), 1)) for room in rooms], dtype=np.int64
+    )
+    proposed = np.zeros(len(rooms), dtype=bool)
+    segment_totals = daily.sum(axis=(0, 2, 3)).astype(float)
+    weights = np.zeros((len(segments), 0))
+
+    for room in proposed_rooms or []:
+        clone_df = bookings[bookings["Room Type"] == room["clone_of"]]
+        if clone_df.empty:
+            raise ValueError(f"Room to clone not found: {room['clone_of']}")
+        clone_city = clone_df["city"].iloc[0]
+        source_df = bookings[bookings["city"] == clone_city]
+
+        # Clone's share of each segment in its own city, scaled to this city
+        seg_total = source_df.groupby(SEGMENT_COLUMNS).size().reindex(seg_index, fill_value=0)
+        seg_clone = clone_df[clone_df["city"] == clone_city].groupby(SEGMENT_COLUMNS).size().reindex(seg_index, fill_value=0)
+        share = ((seg_clone + 1) / (seg_total + 1)).to_numpy(dtype=float)
+        weight = room.get("appeal", 1.0) * share * segment_totals
+
+        for col, allowed in room.get("segments", {}).items():
+            weight = weight * seg_index.get_level_values(col).isin(allowed)
+
+        weights = np.column_stack([weights, weight])
+        rooms.append(room["name"])
+        clone_revenue = clone_df["Revenue"].mean()
+        revenue = np.append(revenue, room.get("revenue", 0 if pd.isna(clone_revenue) else clone_revenue))
+        clone_capacity = seen_capacity.get((clone_city, room["clone_of"]), 1)
+        room_capacity = np.append(room_capacity, room.get("capacity", capacity.get(room["name"], clone_capacity)))
+        proposed = np.append(proposed, True)
+
+    # Share of each segment's bookings that moves to each proposed room, as
+    # if it competed with the existing rooms for the segment's total demand
+    move_share = weights / (segment_totals + weights.sum(axis=1))[:, None]
+
+    return {
+        "city": city,
+        "segments": segments,
+        "slots": slots,
+        "rooms": rooms,
+        "daily_demand": daily,
+        "move_share": move_share,
+        "revenue": revenue,
+        "capacity": room_capacity,
+        "proposed": proposed,
+    }
+
+
+def simulate_batch(model, n_scenarios, horizon_days, seed, demand_scale=1.0, spill_rate=0.5):
+    '''
+    Simulate n_scenarios periods of horizon_days days.
+    Returns (revenue, utilization, lost), arrays of shape (n_scenarios, rooms)
+    for revenue and utilization and (n_scenarios,) for lost bookings.
+    '''
+    # Demand draws get their own generator, so runs with and without
+    # proposed rooms see the same days and counts
+    demand_rng = np.random.default_rng(seed)
+    rng = np.random.default_rng(demand_rng.integers(2**63))
+    daily = model["daily_demand"]
+    move_share = model["move_share"]
+    capacity = model["capacity"]
+    n_existing = daily.shape[3]
+    n_rooms = len(model["rooms"])
+
+    picked = demand_rng.integers(0, daily.shape[0], size=(n_scenarios, horizon_days))
+    wanted = np.zeros((n_scenarios, horizon_days, daily.shape[2], n_rooms), dtype=np.int64)
+    for seg in range(daily.shape[1]):
+        demand = daily[:, seg][picked]
+        if demand_scale > 1:
+            demand = demand + demand_rng.poisson(demand * (demand_scale - 1))
+        elif demand_scale < 1:
+            demand = demand_rng.binomial(demand, demand_scale)
+        if not move_share.shape[1]:
+            wanted[..., :n_existing] += demand
+            continue
+        stay = max(0.0, 1 - move_share[seg].sum())
+        moved = rng.multinomial(demand, np.append(move_share[seg], stay))
+        wanted[..., :n_existing] += moved[..., -1]
+        wanted[..., n_existing:] += moved[..., :-1].sum(axis=-2)
+
+    served = np.minimum(wanted, capacity)
+    overflow = (wanted - served).sum(axis=-1)
+    free = capacity - served
+
+    # Spilled teams pick a free room in proportion to its free capacity
+    free_total = free.sum(axis=-1, keepdims=True)
+    spill_p = np.where(free_total > 0, spill_rate * free / np.maximum(free_total, 1), 0.0)
+    stay_p = np.clip(1 - spill_p.sum(axis=-1, keepdims=True), 0.0, 1.0)
+    spill_p = np.concatenate([spill_p, stay_p], axis=-1)
+    moved = rng.multinomial(overflow, spill_p)[..., :n_rooms]
+    extra = np.minimum(moved, free)
+    served += extra
+
+    sessions = served.sum(axis=(1, 2))
+    revenue = sessions * model["revenue"]
+    utilization = sessions / (capacity * horizon_days * len(model["slots"]))
+    lost = overflow.sum(axis=(1, 2)) - extra.sum(axis=(1, 2, 3))
+    return revenue, utilization, lost
+
+
+def _simulate_task(args):
+    return simulate_batch(*args)
+
+
+def run_simulation(model, n_scenarios=2000, horizon_days=90, seed=0, workers=None,
+                   batch_size=250, demand_scale=1.0, spill_rate=0.5):
+    '''
+    Run n_scenarios in batches across a process pool.
+    The same seed gives the same demand draws, so runs with and without
+    proposed rooms can be compared scenario by scenario.
+    '''
+    sizes = [batch_size] * (n_scenarios // batch_size)
+    if n_scenarios % batch_size:
+        sizes.append(n_scenarios % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(model, size, horizon_days, s, demand_scale, spill_rate) for size, s in zip(sizes, seeds)]
+
+    if workers == 1:
+        results = [_simulate_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_task, tasks))
+
+    revenue = np.concatenate([r[0] for r in results])
+    utilization = np.concatenate([r[1] for r in results])
+    lost = np.concatenate([r[2] for r in results])
+    return revenue, utilization, lost
+
+
+def summarize(model, revenue, utilization, baseline_revenue=None):
+    '''Per-room revenue and utilization distribution as a DataFrame.'''
+    summary = pd.DataFrame({
+        "Room Type": model["rooms"],
+        "proposed": model["proposed"],
+        "revenue_mean": revenue.mean(axis=0),
+        "revenue_p5": np.percentile(revenue, 5, axis=0),
+        "revenue_p50": np.percentile(revenue, 50, axis=0),
+        "revenue_p95": np.percentile(revenue, 95, axis=0),
+        "utilization_mean": utilization.mean(axis=0),
+        "utilization_p5": np.percentile(utilization, 5, axis=0),
+        "utilization_p95": np.percentile(utilization, 95, axis=0),
+    })
+    if baseline_revenue is not None:
+        n_existing = baseline_revenue.shape[1]
+        change = np.zeros(len(model["rooms"]))
+        change[:n_existing] = (revenue[:, :n_existing] - baseline_revenue).mean(axis=0)
+        change[n_existing:] = revenue[:, n_existing:].mean(axis=0)
+        summary["revenue_change_mean"] = change
+    return summary.round(3)
+
+
+def check_baseline(bookings, city, revenue, lost, horizon_days, tolerance=0.05):
+    '''
+    Compare a simulation without proposed rooms to history: lost bookings
+    should be about 0 and revenue about the historical revenue per
+    horizon_days booking days. Prints the comparison and returns True if
+    both are within tolerance (share of historical bookings and revenue).
+    '''
+    city_df = bookings[bookings["city"] == city]
+    days = city_df["Date"].nunique()
+    hist_revenue = city_df["Revenue"].sum() / days * horizon_days
+    hist_bookings = len(city_df) / days * horizon_days
+
+    sim_revenue = revenue.sum(axis=1).mean()
+    lost_mean = lost.mean()
+    print(f"{city} baseline: revenue {sim_revenue:.0f} vs historical {hist_revenue:.0f}, "
+          f"lost bookings {lost_mean:.1f} of {hist_bookings:.0f}")
+    ok = abs(sim_revenue - hist_revenue) <= tolerance * hist_revenue and lost_mean <= tolerance * hist_bookings
+    if not ok:
+        print(f"Warning: {city} baseline does not reproduce history; check capacities before using the deltas")
+    return ok
+
+
+def evaluate_proposals(df, city, proposed_rooms, n_scenarios=2000, horizon_days=90, seed=0, workers=None,
+                       capacity=None, **kwargs):
+    '''
+    Simulate a city with and without the proposed rooms on the same demand
+    scenarios. capacity overrides sessions per slot by room name.
+    At demand_scale 1 the run without proposed rooms is checked against
+    history first.
+    Returns (summary DataFrame, total revenue change per scenario).
+    '''
+    bookings = prepare_bookings(df)
+    baseline_model = build_demand_model(bookings, city, capacity=capacity)
+    model = build_demand_model(bookings, city, proposed_rooms, capacity=capacity)
+
+    base_revenue, _, base_lost = run_simulation(baseline_model, n_scenarios, horizon_days, seed, workers, **kwargs)
+    if kwargs.get("demand_scale", 1.0) == 1:
+        check_baseline(bookings, city, base_revenue, base_lost, horizon_days)
+    revenue, utilization, _ = run_simulation(model, n_scenarios, horizon_days, seed, workers, **kwargs)
+
+    summary = summarize(model, revenue, utilization, baseline_revenue=base_revenue)
+    total_change = revenue.sum(axis=1) - base_revenue.sum(axis=1)
+    return summary, total_change
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    input_file = os.path.join(BASE_DIR, "data", "full_data.csv")
+    full_df = pd.read_csv(input_file, dtype=str)
+
+    scenarios = {
+        "City2": [{"name": "AV2_new", "clone_of": "AV1", "segments": {"TeamType": ["Kids"]}}],
+        "City1": [{"name": "AS4_clone", "clone_of": "AS4"}, {"name": "VS4_clone", "clone_of": "VS4"}],
+    }
+
+    for city, rooms in scenarios.items():
+        summary, total_change = evaluate_proposals(full_df, city, rooms)
+        print(f"\n--- {city} ---")
+        print(summary.to_string(index=False))
+        print(f"Total revenue change per quarter: mean {total_change.mean():.0f}, "
+              f"p5 {np.percentile(total_change, 5):.0f}, p95 {np.percentile(total_change, 95):.0f}")
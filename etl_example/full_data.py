@@ -1,12 +1,93 @@
 import os
+import json
 import pandas as pd
+from row_fingerprint import attach_fingerprint_sidecar, drop_duplicate_fingerprints, FINGERPRINT_COL
+from partitioned_output import write_partitioned, read_partitioned
 
 '''Merge cleaned CSV files from two cities into one dataset.
     Adds a 'city' column to each entry, cleans column names,
-    handles price and escape time, and prepares data for further analysis.'''
-
-
-def merge_city_data(city1_path, city2_path, output_path):
+    handles price and escape time, and prepares data for further analysis.
+    Optionally writes the result partitioned by City/Year/Month.'''
+
+
+SOURCE_COUNTS_FILE = "source_counts.json"
+
+
+def read_city(path, months=None, chunksize=100000):
+    '''
+    Read a cleaned city file, or a City/Year/Month partition directory such
+    as the one merge_cleaned_files writes, with its saved fingerprints.
+    With months ('YYYY-MM' list) only rows of those months are kept: a
+    partition directory reads just their partitions, a file is streamed.
+    '''
+    if os.path.isdir(path):
+        return read_partitioned(path, months=months)
+    if months is None:
+        return attach_fingerprint_sidecar(pd.read_csv(path, dtype=str), path)
+
+    months = set(months)
+    parts = []
+    rows = 0
+    for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize):
+        rows += len(chunk)
+        keep = pd.to_datetime(chunk["Date"], errors="coerce").dt.strftime("%Y-%m").isin(months)
+        parts.append(chunk[keep])
+    df = attach_fingerprint_sidecar(pd.concat(parts), path, rows=rows)
+    return df.reset_index(drop=True)
+
+
+def month_source_counts(df):
+    '''
+    Count Source values per city and 'YYYY-MM' month ('' for invalid dates).
+    Returns {city: {month: {source: count}}}.
+    '''
+    month = pd.to_datetime(df["Date"], errors="coerce").dt.strftime("%Y-%m").fillna("")
+    counts = {}
+    for (city, month_key, source), cnt in df.groupby([df["city"], month, df["Source"]]).size().items():
+        counts.setdefault(city, {}).setdefault(month_key, {})[source] = int(cnt)
+    return counts
+
+
+def load_source_counts(path):
+    '''Load the persisted per-month Source counts, or None if missing.'''
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_source_counts(path, counts):
+    '''Save per-month Source counts via a temp file.'''
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(counts, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def total_source_counts(counts):
+    '''Sum per-month Source counts over all cities and months.'''
+    totals = pd.Series(dtype="int64")
+    for city_counts in counts.values():
+        for month_counts in city_counts.values():
+            totals = totals.add(pd.Series(month_counts, dtype="int64"), fill_value=0)
+    return totals
+
+
+def merge_city_data(city1_path, city2_path, output_path, partition_dir=None, file_format="csv", append=False, months=None):
+    '''
+    Merge both cities and save to output_path (skipped if None).
+    Duplicate rows are dropped on the cleaned-row fingerprints saved next to
+    the city files (computed for a file without them).
+    If partition_dir is given, also write a City/Year/Month partitioned copy;
+    append=True replaces only the partitions present in this run.
+    Source counts per city and month are saved in partition_dir, so the
+    rare-source rule of a monthly refresh needs no other months' data.
+    If months ('YYYY-MM' list) is given, only rows of those months are read
+    and only their partitions and counts are replaced; output_path is
+    skipped as it would no longer hold the full history. This needs the
+    counts of an earlier full merge into partition_dir. Pass partition
+    directories as city paths to read only those months from disk.
+    '''
 
     drop_columns = [
         'Extra1','Extra2','Extra3','Extra4','Extra5','Extra6',
@@ -18,11 +99,20 @@ def merge_city_data(city1_path, city2_path, output_path):
         print("One or both input files do not exist.")
         return
 
-    df1 = pd.read_csv(city1_path, dtype=str)
+    counts_path = os.path.join(partition_dir, SOURCE_COUNTS_FILE) if partition_dir is not None else None
+    stored_counts = None
+    if months is not None:
+        stored_counts = load_source_counts(counts_path) if counts_path is not None else None
+        if stored_counts is None:
+            print("A monthly refresh needs the Source counts of a full merge into partition_dir. Run one first.")
+            return
+
+    df1 = read_city(city1_path, months)
+    df2 = read_city(city2_path, months)
+
     df1["city"] = "City1"
     df1.drop(columns=[col for col in drop_columns if col in df1.columns], inplace=True)
 
-    df2 = pd.read_csv(city2_path, dtype=str)
     df2["city"] = "City2"
     df2.drop(columns=[col for col in drop_columns if col in df2.columns], inplace=True)
 
@@ -53,18 +143,48 @@ def merge_city_data(city1_path, city2_path, output_path):
     if "EscapeTime" in merged_df.columns:
         merged_df["EscapeTime"] = merged_df["EscapeTime"].replace("-", pd.NA)
 
+    new_counts = None
     if "Source" in merged_df.columns:
         merged_df["Source"] = merged_df["Source"].fillna("").str.strip().str.upper()
-        counts = merged_df["Source"].value_counts()
+        new_counts = month_source_counts(merged_df)
+        if stored_counts is None:
+            counts = merged_df["Source"].value_counts()
+        else:
+            # Replace the refreshed months' counts, keep all other months
+            for city_counts in stored_counts.values():
+                for month in months:
+                    city_counts.pop(month, None)
+            for city, city_counts in new_counts.items():
+                stored_counts.setdefault(city, {}).update(city_counts)
+            counts = total_source_counts(stored_counts)
         rare = counts[counts < 20].index
         merged_df.loc[merged_df["Source"].isin(rare), "Source"] = "ONLINE"
         merged_df.loc[merged_df["Source"] == "", "Source"] = "ONLINE"
 
-    merged_df.drop_duplicates(inplace=True)
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    merged_df.to_csv(output_path, index=False)
-    print(f"Merged data saved to: {output_path}")
+    # Deduplicate on the cleaned-row fingerprint carried from each city file;
+    # it is not part of the published schema
+    merged_df = drop_duplicate_fingerprints(merged_df, subset=["city"])
+    merged_df = merged_df.drop(columns=[FINGERPRINT_COL])
+
+    if output_path is not None and months is not None:
+        print(f"Skipping {output_path}: only months {months} were merged")
+    elif output_path is not None:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        merged_df.to_csv(output_path, index=False)
+        print(f"Merged data saved to: {output_path}")
+
+    if partition_dir is not None:
+        write_partitioned(merged_df, partition_dir, city_col="city", file_format=file_format, append=append, months=months)
+        if months is None:
+            # Same scope as the partitions: other cities are kept, and append
+            # keeps the months not in this run
+            stored_counts = load_source_counts(counts_path) or {}
+            for city, city_counts in (new_counts or {}).items():
+                if append:
+                    stored_counts.setdefault(city, {}).update(city_counts)
+                else:
+                    stored_counts[city] = city_counts
+        save_source_counts(counts_path, stored_counts)
 
 
 if __name__ == "__main__":
@@ -73,8 +193,9 @@ if __name__ == "__main__":
     city1_file = os.path.join(BASE_DIR, "data", "city1", "cleaned", "city1_all.csv")
     city2_file = os.path.join(BASE_DIR, "data", "city2", "cleaned", "city2_all.csv")
     output_file = os.path.join(BASE_DIR, "data", "full_data.csv")
+    partition_dir = os.path.join(BASE_DIR, "data", "full_data_partitioned")
 
     print("City1 file exists:", os.path.exists(city1_file))
     print("City2 file exists:", os.path.exists(city2_file))
 
-    merge_city_data(city1_file, city2_file, output_file)
+    merge_city_data(city1_file, city2_file, output_file, partition_dir=partition_dir)
@@ -0,0 +1,165 @@
+import os
+from difflib import SequenceMatcher
+import pandas as pd
+from data_cleaning_city1 import COLUMN_ALIASES, add_time_slot, normalize_text
+
+'''Find bookings that were logged twice with small differences.
+
+- Exact drop_duplicates misses rows with a different admin spelling,
+  a missing age or a slightly different start time
+- Rows are blocked on (Date, rounded Time, Room Type, City), so only rows
+  of the same session slot are compared and the run stays roughly linear
+- Pairs inside a block get a weighted field similarity score; pairs whose
+  actual start times differ by more than MAX_START_DIFF_MINUTES never link,
+  as a slot can hold back-to-back sessions (e.g. 13:30 and 15:00 -> 14:00)
+- Pairs above the threshold are joined into clusters with a confidence
+- drop_near_duplicates keeps the first row of each cluster'''
+
+
+BLOCK_COLUMNS = ["Date", "Slot", "Room Type", "city"]
+
+# Separate sessions in one room are at least this far apart
+MAX_START_DIFF_MINUTES = 30
+
+FIELD_WEIGHTS = {
+    "Start Minutes": 3.0,
+    "Admin": 1.0,
+    "Age Group": 1.5,
+    "TeamType": 1.0,
+    "Revenue": 2.0,
+    "Helps": 0.5,
+    "Escape Time": 2.0,
+    "Source": 1.0,
+    "Status": 1.0,
+    "Celebration": 0.5,
+}
+
+NUMERIC_FIELDS = {"Revenue", "Helps", "Escape Time"}
+MISSING_VALUES = {"", "-", "N/A", "NAN", "NONE", "<NA>"}
+
+# A field missing on one side neither confirms nor rules out a match
+MISSING_SIMILARITY = 0.5
+
+
+def _is_missing(value):
+    return pd.isna(value) or str(value).strip().upper() in MISSING_VALUES
+
+
+def _to_number(value):
+    return pd.to_numeric(str(value).upper().replace("E", "").strip(), errors="coerce")
+
+
+def field_similarity(field, a, b):
+    '''Similarity of two values of one field, between 0 and 1.'''
+    if _is_missing(a) or _is_missing(b):
+        return MISSING_SIMILARITY
+
+    if field == "Start Minutes":
+        return max(0.0, 1 - abs(float(a) - float(b)) / MAX_START_DIFF_MINUTES)
+
+    if field in NUMERIC_FIELDS:
+        x, y = _to_number(a), _to_number(b)
+        if pd.isna(x) or pd.isna(y):
+            return MISSING_SIMILARITY
+        largest = max(abs(x), abs(y))
+        return 1.0 if largest == 0 else max(0.0, 1 - abs(x - y) / largest)
+
+    x, y = normalize_text(str(a)), normalize_text(str(b))
+    if x == y:
+        return 1.0
+    return SequenceMatcher(None, x, y).ratio()
+
+
+def row_similarity(row_a, row_b, weights=None):
+    '''Weighted similarity of two rows over the fields present in both.'''
+    weights = weights or FIELD_WEIGHTS
+    total = 0.0
+    weight_sum = 0.0
+    for field, weight in weights.items():
+        if field not in row_a.index or field not in row_b.index:
+            continue
+        total += weight * field_similarity(field, row_a[field], row_b[field])
+        weight_sum += weight
+    return total / weight_sum if weight_sum else 0.0
+
+
+def find_near_duplicates(df, threshold=0.8, weights=None, max_block_size=50):
+    '''
+    Return one row per near-duplicate record with columns
+    'row' (index in df), 'cluster' and 'confidence'.
+    The confidence of a cluster is the lowest pair score that links it.
+    Blocks larger than max_block_size are skipped as they are not one session.
+    '''
+    df = df.rename(columns=COLUMN_ALIASES)
+    df = add_time_slot(df.copy())
+
+    keys = [col for col in BLOCK_COLUMNS if col in df.columns]
+    blocked = df.dropna(subset=keys)
+    sizes = blocked.groupby(keys, sort=False)[keys[0]].transform("size")
+    candidates = blocked[sizes > 1]
+
+    parent = {}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    link_scores = {}
+    skipped = 0
+    for _, block in candidates.groupby(keys, sort=False):
+        if len(block) > max_block_size:
+            skipped += 1
+            continue
+        rows = list(block.iterrows())
+        for pos, (idx_a, row_a) in enumerate(rows):
+            for idx_b, row_b in rows[pos + 1:]:
+                start_a, start_b = row_a["Start Minutes"], row_b["Start Minutes"]
+                if pd.notna(start_a) and pd.notna(start_b) and abs(start_a - start_b) > MAX_START_DIFF_MINUTES:
+                    continue
+                score = row_similarity(row_a, row_b, weights)
+                if score < threshold:
+                    continue
+                parent.setdefault(idx_a, idx_a)
+                parent.setdefault(idx_b, idx_b)
+                root_a, root_b = find(idx_a), find(idx_b)
+                merged_score = min(score, link_scores.pop(root_a, 1.0), link_scores.pop(root_b, 1.0))
+                if root_a != root_b:
+                    parent[root_b] = root_a
+                link_scores[root_a] = merged_score
+
+    if skipped:
+        print(f"Skipped {skipped} blocks larger than {max_block_size} rows")
+
+    if not parent:
+        return pd.DataFrame(columns=["row", "cluster", "confidence"])
+
+    result = pd.DataFrame({"row": list(parent)})
+    roots = result["row"].map(find)
+    result["cluster"] = pd.factorize(roots)[0]
+    result["confidence"] = roots.map(link_scores).round(3)
+    return result.sort_values(["cluster", "row"]).reset_index(drop=True)
+
+
+def drop_near_duplicates(df, threshold=0.8, weights=None):
+    '''Drop all but the first row of every near-duplicate cluster.'''
+    clusters = find_near_duplicates(df, threshold, weights)
+    if clusters.empty:
+        return df
+    first_rows = clusters.groupby("cluster")["row"].transform("min")
+    extra_rows = clusters.loc[clusters["row"] != first_rows, "row"]
+    print(f"Dropping {len(extra_rows)} near-duplicate rows in {clusters['cluster'].nunique()} clusters")
+    return df.drop(index=extra_rows)
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    input_file = os.path.join(BASE_DIR, "data", "full_data.csv")
+    output_file = os.path.join(BASE_DIR, "data", "near_duplicates.csv")
+
+    full_df = pd.read_csv(input_file, dtype=str)
+    clusters = find_near_duplicates(full_df)
+    report = clusters.join(full_df, on="row")
+    report.to_csv(output_file, index=False)
+    print(f"Found {clusters['cluster'].nunique()} near-duplicate clusters, saved to: {output_file}")
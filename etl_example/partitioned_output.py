@@ -0,0 +1,159 @@
+import os
+import re
+import glob
+import shutil
+import pandas as pd
+from row_fingerprint import FINGERPRINT_COL, fingerprint_sidecar_path, save_fingerprint_sidecar, attach_fingerprint_sidecar
+
+'''Write and read merged data as a directory partitioned by City/Year/Month.
+
+- Layout: <root>/City=<city>/Year=<yyyy>/Month=<mm>/part.<csv|parquet>
+- Overwrite mode rebuilds the partitions of the written cities, append mode
+  replaces only the partitions present in the current run
+- A months filter ('YYYY-MM' list) limits a refresh to the touched months
+- Each partition file is written to a temp file first and then swapped in
+- A fingerprint column is kept out of the part files, in a sidecar next to them
+- The reader prunes partitions from city and date filters before loading,
+  so reading one month does not touch other years'''
+
+
+PARTITION_RE = re.compile(r'City=(?P<city>[^/\\]+)[/\\]Year=(?P<year>\d{4})[/\\]Month=(?P<month>\d{2})')
+
+FILE_FORMATS = {"csv": "part.csv", "parquet": "part.parquet"}
+
+
+def _partition_path(root, city, year, month, file_format):
+    return os.path.join(root, f"City={city}", f"Year={year:04d}", f"Month={month:02d}", FILE_FORMATS[file_format])
+
+
+def _write_partition(df, path, file_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if FINGERPRINT_COL in df.columns:
+        save_fingerprint_sidecar(path, df[FINGERPRINT_COL])
+        df = df.drop(columns=[FINGERPRINT_COL])
+    elif os.path.exists(fingerprint_sidecar_path(path)):
+        os.remove(fingerprint_sidecar_path(path))
+    tmp_path = path + ".tmp"
+    if file_format == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def touched_months(dates):
+    '''Sorted 'YYYY-MM' months present in a Series of dates.'''
+    months = pd.to_datetime(dates, errors="coerce").dt.strftime("%Y-%m").dropna()
+    return sorted(months.unique())
+
+
+def write_partitioned(df, root, date_col="Date", city_col="city", city=None, file_format="csv",
+                      append=False, months=None):
+    '''
+    Write df under root partitioned by City/Year/Month.
+    city sets a constant city when df has no city column.
+    With append=True only the partitions present in df are replaced;
+    otherwise the existing partitions of the cities in df are removed
+    first. Other cities under root are never touched.
+    months ('YYYY-MM' list) restricts the write to those months and implies
+    append=True, so a monthly refresh rewrites only that month's partitions.
+    Returns the list of written partition files.
+    '''
+    if file_format not in FILE_FORMATS:
+        print(f"Unknown file format: {file_format}. Use one of {list(FILE_FORMATS)}.")
+        return []
+
+    dates = pd.to_datetime(df[date_col], errors="coerce")
+    bad = dates.isna().sum()
+    if bad:
+        print(f"Skipping {bad} rows with invalid '{date_col}' in partitioned output")
+
+    if city_col in df.columns:
+        cities = df[city_col].fillna("")
+    else:
+        cities = pd.Series(city or "", index=df.index)
+
+    if months is not None:
+        append = True
+        keep = dates.dt.strftime("%Y-%m").isin(set(months))
+        df, dates, cities = df[keep], dates[keep], cities[keep]
+
+    if not append:
+        for city_name in cities.unique():
+            old = os.path.join(root, f"City={city_name}")
+            if os.path.isdir(old):
+                shutil.rmtree(old)
+
+    written = []
+    keys = [cities.rename("City"), dates.dt.year.rename("Year"), dates.dt.month.rename("Month")]
+    for (city_name, year, month), part in df.groupby(keys, sort=True):
+        path = _partition_path(root, city_name, int(year), int(month), file_format)
+        _write_partition(part, path, file_format)
+        written.append(path)
+
+    mode = "Replaced" if append else "Wrote"
+    print(f"{mode} {len(written)} partitions in {root}")
+    return written
+
+
+def list_partitions(root, cities=None, start_date=None, end_date=None, months=None):
+    '''
+    Return partition files under root that can contain rows matching the
+    filters. months is an optional 'YYYY-MM' list.
+    Only directory names are inspected, no data is read.
+    '''
+    start = pd.Timestamp(start_date).to_period("M") if start_date is not None else None
+    end = pd.Timestamp(end_date).to_period("M") if end_date is not None else None
+    wanted = set(cities) if cities is not None else None
+    months = set(months) if months is not None else None
+
+    selected = []
+    for path in sorted(glob.glob(os.path.join(root, "City=*", "Year=*", "Month=*", "part.*"))):
+        match = PARTITION_RE.search(os.path.relpath(path, root))
+        if not match or os.path.basename(path) not in FILE_FORMATS.values():
+            continue
+        if wanted is not None and match["city"] not in wanted:
+            continue
+        period = pd.Period(year=int(match["year"]), month=int(match["month"]), freq="M")
+        if start is not None and period < start:
+            continue
+        if end is not None and period > end:
+            continue
+        if months is not None and str(period) not in months:
+            continue
+        selected.append(path)
+    return selected
+
+
+def read_partitioned(root, cities=None, start_date=None, end_date=None, date_col="Date", months=None):
+    '''
+    Read only the partitions matching the city and date filters, then trim
+    rows in the boundary months to the exact date range.
+    Fingerprints saved with the partitions are added back as a column.
+    '''
+    paths = list_partitions(root, cities, start_date, end_date, months)
+    if not paths:
+        print(f"No partitions in {root} match the filters.")
+        return pd.DataFrame()
+
+    df_list = []
+    for path in paths:
+        if path.endswith(".parquet"):
+            part = pd.read_parquet(path)
+        else:
+            part = pd.read_csv(path, dtype=str)
+        if os.path.exists(fingerprint_sidecar_path(path)):
+            part = attach_fingerprint_sidecar(part, path)
+        df_list.append(part)
+    df = pd.concat(df_list, ignore_index=True, sort=False)
+
+    if start_date is not None or end_date is not None:
+        dates = pd.to_datetime(df[date_col], errors="coerce")
+        mask = pd.Series(True, index=df.index)
+        if start_date is not None:
+            mask &= dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= dates <= pd.Timestamp(end_date)
+        df = df[mask]
+
+    return df.reset_index(drop=True)
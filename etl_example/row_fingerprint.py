@@ -0,0 +1,148 @@
+import os
+import numpy as np
+import pandas as pd
+
+'''Row fingerprints used for deduplication across the pipeline.
+
+- A 64-bit hash of each raw row is computed once while combining monthly files
+- Cleaning replaces it with a hash of the cleaned row, carried to the final merge
+- Published CSVs keep their columns; fingerprints are saved next to them
+  in a .fingerprints.npy sidecar
+- Deduplication becomes a single integer-column operation
+- A persisted set of seen fingerprints lets new months be deduplicated
+  against history without reloading it'''
+
+
+FINGERPRINT_COL = "RowFingerprint"
+
+# Odd 64-bit constant used to chain the per-cell hashes of a row
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def compute_row_fingerprint(df, columns=None):
+    '''
+    Return a 64-bit (int64) fingerprint per row.
+    Only the row's own non-null (column, value) pairs are hashed, in sorted
+    column order, so a row keeps its fingerprint whatever other columns the
+    frame holds (e.g. a column that only a later monthly file has).
+    Values are hashed as strings; hash raw values before parsing them.
+    '''
+    if columns is None:
+        columns = [col for col in df.columns if col != FINGERPRINT_COL]
+
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for col in sorted(columns, key=str):
+        values = df[col].astype(str)
+        # Empty strings count as missing, as they read back from CSV as NaN
+        present = (df[col].notna() & (values != "")).to_numpy()
+        cells = (f"{col}\x1f" + values[present]).to_numpy(dtype=object)
+        hashes[present] = hashes[present] * HASH_MULTIPLIER + pd.util.hash_array(cells)
+    return pd.Series(hashes.view(np.int64), index=df.index, name=FINGERPRINT_COL)
+
+
+def add_row_fingerprint(df, columns=None):
+    '''
+    Add the fingerprint column in place. An existing column (e.g. read back
+    as strings) is converted to int64 and only missing values are computed.
+    '''
+    if FINGERPRINT_COL not in df.columns:
+        df[FINGERPRINT_COL] = compute_row_fingerprint(df, columns)
+        return df
+
+    existing = df[FINGERPRINT_COL]
+    if existing.dtype == np.int64:
+        return df
+
+    missing = existing.isna()
+    if missing.any():
+        existing = existing.astype(object)
+        existing[missing] = compute_row_fingerprint(df.loc[missing], columns)
+    # Parse via int() so 64-bit values never pass through float
+    df[FINGERPRINT_COL] = np.array([int(v) for v in existing], dtype=np.int64)
+    return df
+
+
+def drop_duplicate_fingerprints(df, subset=None):
+    '''
+    Drop duplicate rows using the fingerprint column (computed if missing).
+    Extra key columns (e.g. 'city') can be passed via subset.
+    '''
+    add_row_fingerprint(df)
+    keys = [FINGERPRINT_COL] + list(subset or [])
+    return df.drop_duplicates(subset=keys)
+
+
+def fingerprint_sidecar_path(path):
+    '''Path of the .npy file holding the fingerprints of a data file's rows.'''
+    return os.path.splitext(path)[0] + ".fingerprints.npy"
+
+
+def save_fingerprint_sidecar(path, fingerprints):
+    '''Save row fingerprints, in row order, next to the data file at path.'''
+    with open(fingerprint_sidecar_path(path), "wb") as f:
+        np.save(f, np.asarray(fingerprints, dtype=np.int64))
+
+
+def to_csv_with_fingerprints(df, path):
+    '''Write df to CSV without the fingerprint column and save it to the sidecar.'''
+    df.drop(columns=[FINGERPRINT_COL]).to_csv(path, index=False)
+    save_fingerprint_sidecar(path, df[FINGERPRINT_COL])
+
+
+def attach_fingerprint_sidecar(df, path, rows=None):
+    '''
+    Add the fingerprint column to df, read from the file at path, using its
+    sidecar. If df holds only some rows of the file, its index must be their
+    row positions and rows the file's row count. Without a sidecar matching
+    the row count, the fingerprints are computed from the row values.
+    '''
+    sidecar = fingerprint_sidecar_path(path)
+    if os.path.exists(sidecar):
+        fingerprints = np.load(sidecar)
+        if rows is None and len(fingerprints) == len(df):
+            df[FINGERPRINT_COL] = fingerprints
+            return df
+        if rows is not None and len(fingerprints) == rows:
+            df[FINGERPRINT_COL] = fingerprints[df.index.to_numpy()]
+            return df
+    df[FINGERPRINT_COL] = compute_row_fingerprint(df)
+    return df
+
+
+def load_seen_fingerprints(path):
+    '''Load the persisted fingerprint set. Returns an empty array if missing.'''
+    if not path or not os.path.exists(path):
+        return np.empty(0, dtype=np.int64)
+    return np.load(path)
+
+
+def save_seen_fingerprints(path, fingerprints):
+    '''Save fingerprints as a sorted, unique int64 array (.npy).'''
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "wb") as f:
+        np.save(f, np.unique(np.asarray(fingerprints, dtype=np.int64)))
+
+
+def add_seen_fingerprints(path, fingerprints):
+    '''Union fingerprints into the persisted set.'''
+    seen = load_seen_fingerprints(path)
+    save_seen_fingerprints(path, np.concatenate([seen, np.asarray(fingerprints, dtype=np.int64)]))
+
+
+def drop_seen_fingerprints(df, seen_path):
+    '''
+    Remove rows whose fingerprint is already in the persisted set, then add
+    the remaining fingerprints to it. Returns only the unseen rows.
+    '''
+    add_row_fingerprint(df)
+    seen = load_seen_fingerprints(seen_path)
+
+    df = df.drop_duplicates(subset=[FINGERPRINT_COL])
+    new_mask = ~np.isin(df[FINGERPRINT_COL].to_numpy(), seen, assume_unique=True)
+    new_rows = df[new_mask]
+
+    if seen_path:
+        save_seen_fingerprints(seen_path, np.concatenate([seen, new_rows[FINGERPRINT_COL].to_numpy()]))
+    return new_rows
@@ -0,0 +1,91 @@
+import csv
+import random
+import warnings
+import numpy as np
+import pytest
+from data_cleaning_city1 import process_file
+from data_quality_sketches import DataQualitySketch
+from row_fingerprint import fingerprint_sidecar_path
+
+'''process_file with chunksize must write the same file as the in-memory mode.'''
+
+
+HEADER = ["Date", "Time", "Room Type", "Revenue", "Helps", "Escape Time", "Age", "",
+          "Source", "Status", "Celebration", "Admin"]
+
+
+def write_synthetic_file(path, n_rows=600, seed=1):
+    '''Messy bookings: duplicates, other years, empty and merged prices, bad times.'''
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n_rows):
+        if rng.random() < 0.05:
+            date = rng.choice(["2022-01-01", "bad", ""])
+        else:
+            date = f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        rows.append([
+            date,
+            rng.choice(["12:10:00", "14:00", "", "", "19:55:00", "xx", "09:00:00"]),
+            rng.choice(["AS1", "kv1a", "AS4B", "PETRAS", "XX", "AV2", "KS1C", ""]),
+            rng.choice(["160", "NO_PRICE", "NO_PRICE", "", "80E", "GIFT", "5", "700", "120 E", ""]),
+            rng.choice(["1", "", "x", "3"]),
+            rng.choice(["00:54:30", "", "45:00", "bad"]),
+            rng.choice(["12", "", "25 m", "8"]),
+            rng.choice(["", "30"]),
+            rng.choice(["ONLINE search", "", "fb", "coupon x"]),
+            rng.choice(["friends_variant_a", "", ", ", "students"]),
+            rng.choice(["christmas", ""]),
+            rng.choice(["Egle", "", "Ąsta", ""]),
+        ])
+        if rng.random() < 0.05:
+            rows.append(rows[-1])
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+
+def run_both(input_path, tmp_path, chunksize):
+    mem_path = tmp_path / "in_memory.csv"
+    chunk_path = tmp_path / f"chunked_{chunksize}.csv"
+    mem_sketch, chunk_sketch = DataQualitySketch(), DataQualitySketch()
+    mem_months, chunk_months = {}, {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        process_file(str(input_path), str(mem_path), sketch=mem_sketch, month_sketches=mem_months)
+        process_file(str(input_path), str(chunk_path), sketch=chunk_sketch, chunksize=chunksize,
+                     month_sketches=chunk_months)
+    return (mem_path, mem_sketch, mem_months), (chunk_path, chunk_sketch, chunk_months)
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 7, 64, 5000])
+def test_chunked_output_matches_in_memory(tmp_path, chunksize):
+    input_path = tmp_path / "combined_data_2023.csv"
+    write_synthetic_file(input_path)
+
+    (mem_path, mem_sketch, mem_months), (chunk_path, chunk_sketch, chunk_months) = run_both(
+        input_path, tmp_path, chunksize
+    )
+
+    assert chunk_path.read_bytes() == mem_path.read_bytes()
+    np.testing.assert_array_equal(
+        np.load(fingerprint_sidecar_path(str(chunk_path))), np.load(fingerprint_sidecar_path(str(mem_path)))
+    )
+    assert chunk_sketch.to_dict() == mem_sketch.to_dict()
+    assert {m: s.to_dict() for m, s in chunk_months.items()} == {m: s.to_dict() for m, s in mem_months.items()}
+
+
+def test_chunked_writes_header_when_cleaning_drops_every_row(tmp_path):
+    input_path = tmp_path / "combined_data_2023.csv"
+    input_path.write_text(
+        "Date,Time,Room Type,Revenue,Admin\n"
+        "2023-01-02,12:00,PETRAS,80,Egle\n"
+        "2023-01-03,14:00,,80,Egle\n"
+        "2023-01-04,16:00,PETRAS,,\n",
+        encoding="utf-8",
+    )
+
+    (mem_path, _, _), (chunk_path, _, _) = run_both(input_path, tmp_path, chunksize=2)
+
+    assert mem_path.read_text(encoding="utf-8").count("\n") == 1
+    assert chunk_path.read_bytes() == mem_path.read_bytes()